@@ -1,8 +1,17 @@
 import streamlit as st
-from nba_api.stats.endpoints import playergamelog
+from nba_api.stats.endpoints import leaguegamefinder
+from nba_api.stats.library.http import NBAStatsHTTP, STATS_HEADERS
 from nba_api.stats.static import players
-import pandas as pd
+import numpy as np
+import random
+import requests
+import requests_cache
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from urllib3.util.retry import Retry
 
 # Configure page settings
 st.set_page_config(
@@ -12,7 +21,7 @@ st.set_page_config(
 )
 
 # Custom CSS
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .stat-box {
         background-color: #1E1E1E;
@@ -30,70 +39,261 @@ st.markdown("""
         font-size: 14px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
 
-@st.cache_data(ttl=3600)
+# Re-emitted on every run: Streamlit drops elements a rerun doesn't write,
+# so guarding this with session_state would lose the styles after one click.
+# An unchanged element is diffed away on the frontend and costs no DOM work.
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+@st.cache_resource(show_spinner=False)
+def get_player_index():
+    """Lowercased full name -> player ID, built once per process.
+
+    Repeated names keep their first entry, matching find_players_by_full_name()[0].
+    """
+    index = {}
+    for p in players.get_players():
+        index.setdefault(p['full_name'].lower(), p['id'])
+    return index
+
+@st.cache_data(persist="disk", show_spinner=False)
 def get_player_id(player_name):
     """Get player ID from name"""
+    player_id = get_player_index().get(player_name.strip().lower())
+    if player_id is not None:
+        return player_id
+    # Fall back to nba_api's partial/regex match
     player_dict = players.find_players_by_full_name(player_name)
     if not player_dict:
         return None
     return player_dict[0]['id']
 
-@st.cache_data(ttl=3600)
-def get_career_clutch_stats(player_id):
-    """Get player's career clutch performance"""
-    try:
-        all_games = pd.DataFrame()
-        current_season = "2023-24"
-        
-        # First try current season
-        try:
-            gamelog = playergamelog.PlayerGameLog(
-                player_id=player_id,
-                season=current_season
-            ).get_data_frames()[0]
-            all_games = pd.concat([all_games, gamelog])
-            time.sleep(0.6)  # Rate limiting
-        except:
-            pass
-            
-        # Then try last few seasons for newer players
-        for year in range(2022, 2014, -1):
+# nba_api's defaults send no-cache, which would bypass the response cache
+NBA_HEADERS = {k: v for k, v in STATS_HEADERS.items() if k not in ("Pragma", "Cache-Control")}
+
+# Close games: final margin within this many points
+CLUTCH_MARGIN = 5
+
+# SEASON_ID is prefixed by season type: 1 = preseason, 2 = regular, 4 = playoffs
+REGULAR_SEASON_PREFIX = '2'
+
+# Only these game-log columns are used; downcast to shrink the working set.
+# PLUS_MINUS stays float because it is null before 1996-97.
+GAME_LOG_DTYPES = {
+    'PTS': 'int16',
+    'FG_PCT': 'float32',
+    'FT_PCT': 'float32',
+    'PLUS_MINUS': 'float32'
+}
+GAME_LOG_COLUMNS = ['SEASON_ID', *GAME_LOG_DTYPES]
+
+CLUTCH_AGG = {
+    'PTS': ['mean', 'sum'],
+    'FG_PCT': 'mean',
+    'FT_PCT': 'mean',
+    'PLUS_MINUS': 'mean'
+}
+
+MAX_ATTEMPTS = 4
+
+class _RateLimiter:
+    """Spaces out NBA API requests across threads"""
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def wait(self):
+        with self._lock:
+            delay = self._last_request + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._last_request = time.monotonic()
+
+class NBAClient:
+    """Single entry point for NBA API requests.
+
+    Owns the keep-alive session (backed by a 24-hour SQLite response cache),
+    the retry policy and a ~5 requests/second rate limiter, so concurrent
+    fetches for both players share connections and backoff state.
+    """
+    def __init__(self):
+        self.limiter = _RateLimiter(min_interval=0.2)
+        # One SQLite store shared by every session this client creates
+        self._cache = requests_cache.SQLiteCache(".nba_cache")
+        self._session_lock = threading.Lock()
+        self.session = None
+        self.reset_session()
+
+    def reset_session(self, stale=None):
+        """Install a fresh session, e.g. after connections timed out.
+
+        Pass the session that failed as ``stale``; if another thread has
+        already replaced it, the current session is kept.
+        """
+        with self._session_lock:
+            if stale is not None and self.session is not stale:
+                return
+            session = requests_cache.CachedSession(
+                backend=self._cache,
+                expire_after=86400,
+                allowable_codes=(200,),
+                stale_if_error=True
+            )
+            session.headers.update({
+                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:72.0) Gecko/20100101 Firefox/72.0",
+                "Referer": "https://stats.nba.com/",
+                "Connection": "keep-alive"
+            })
+            # Status codes only: timeouts and connection errors are retried by call()
+            retries = Retry(
+                total=None,
+                connect=0,
+                read=0,
+                other=0,
+                status=4,
+                backoff_factor=1.5,
+                backoff_jitter=1.0,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["GET"],
+                respect_retry_after_header=True
+            )
+            session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retries))
+            NBAStatsHTTP.set_session(session)
+            old, self.session = self.session, session
+        if old is not None:
+            # Close the pooled sockets only; the SQLite cache is shared
+            requests.Session.close(old)
+
+    def call(self, request):
+        """Run an endpoint request, retrying timeouts and dropped connections.
+
+        Status-code retries (429/5xx) happen in the session's HTTPAdapter; this
+        covers failures that never produce a response. Waits grow exponentially
+        with random jitter so concurrent callers don't retry in lockstep.
+        """
+        for attempt in range(MAX_ATTEMPTS):
+            self.limiter.wait()
+            session = self.session
             try:
-                season = f"{year}-{str(year+1)[-2:]}"
-                gamelog = playergamelog.PlayerGameLog(
-                    player_id=player_id,
-                    season=season
-                ).get_data_frames()[0]
-                all_games = pd.concat([all_games, gamelog])
-                time.sleep(0.6)  # Rate limiting
-            except:
-                continue
-        
-        if all_games.empty:
-            return {"error": "No games found"}
-            
-        # Define clutch games (close games - margin ≤ 5 points)
-        clutch_games = all_games[abs(all_games['PLUS_MINUS']) <= 5]
+                return request()
+            except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+                self.reset_session(stale=session)
+                time.sleep(2 ** attempt + random.random())
+
+    def get_career_games(self, player_id):
+        """Fetch every game of a player's career (all season types) in one request"""
+        games = self.call(
+            lambda: leaguegamefinder.LeagueGameFinder(
+                player_or_team_abbreviation="P",
+                player_id_nullable=player_id,
+                league_id_nullable="00",
+                headers=NBA_HEADERS
+            ).get_data_frames()[0]
+        )
+        return games[GAME_LOG_COLUMNS].astype(GAME_LOG_DTYPES)
+
+@st.cache_resource(show_spinner=False)
+def get_nba_client():
+    """Process-wide NBAClient shared by every session and rerun"""
+    return NBAClient()
+
+_NBA_CLIENT = get_nba_client()
+
+# Not persisted: Streamlit ignores ttl for persist="disk", and the raw
+# responses already survive restarts in the requests-cache store
+@st.cache_data(ttl=86400, show_spinner=False)
+def _load_career_clutch_stats(player_id):
+    """Compute career clutch stats; raises on fetch errors so they aren't cached.
+
+    Keyed on the integer player_id and returns a small dict of plain Python
+    numbers; the game-log DataFrame never enters the cache.
+    """
+    all_games = _NBA_CLIENT.get_career_games(player_id)
+    
+    # Filter with masks so the career log is copied only once
+    regular_season = all_games['SEASON_ID'].str.startswith(REGULAR_SEASON_PREFIX).to_numpy()
+    total_games = np.count_nonzero(regular_season)
+    if total_games == 0:
+        return {"error": "No games found"}
         
-        # Calculate career clutch stats
-        stats = {
-            'games_played': len(clutch_games),
-            'ppg': round(clutch_games['PTS'].mean(), 1) if not clutch_games.empty else 0,
-            'fg_pct': round(clutch_games['FG_PCT'].mean() * 100, 1) if not clutch_games.empty else 0,
-            'ft_pct': round(clutch_games['FT_PCT'].mean() * 100, 1) if not clutch_games.empty else 0,
-            'plus_minus': round(clutch_games['PLUS_MINUS'].mean(), 1) if not clutch_games.empty else 0,
-            'win_pct': round((clutch_games['PLUS_MINUS'] > 0).mean() * 100, 1) if not clutch_games.empty else 0,
-            'total_points': int(clutch_games['PTS'].sum()) if not clutch_games.empty else 0,
-            'total_games': len(all_games),
-            'clutch_game_pct': round(len(clutch_games) / len(all_games) * 100, 1) if not all_games.empty else 0
-        }
+    # PLUS_MINUS is only recorded from 1996-97 on; older games can't be
+    # classified, so they stay out of the clutch-share denominator
+    plus_minus_all = all_games['PLUS_MINUS'].to_numpy()
+    tracked_games = np.count_nonzero(regular_season & ~np.isnan(plus_minus_all))
+    if tracked_games == 0:
+        return {"error": "No plus/minus data (only recorded since 1996-97)"}
         
-        return stats
+    # Define clutch games (close games - margin ≤ 5 points)
+    close_game = np.abs(plus_minus_all) <= CLUTCH_MARGIN
+    clutch = regular_season & close_game
+    clutch_games = all_games.iloc[clutch]
+    
+    # Calculate career clutch stats
+    if clutch_games.empty:
+        ppg = fg_pct = ft_pct = plus_minus = win_pct = total_points = 0
+    else:
+        agg = clutch_games.agg(CLUTCH_AGG)
+        # Pull the mean row out once and work on it positionally
+        means = agg.loc['mean', ['PTS', 'FG_PCT', 'FT_PCT', 'PLUS_MINUS']].to_numpy(dtype=np.float64)
+        means[1:3] *= 100
+        ppg, fg_pct, ft_pct, plus_minus = np.round(means, 1).tolist()
+        clutch_plus_minus = plus_minus_all[clutch]
+        win_pct = round(np.count_nonzero(clutch_plus_minus > 0) / clutch_plus_minus.size * 100, 1)
+        total_points = int(agg.loc['sum', 'PTS'])
+    
+    stats = {
+        'games_played': len(clutch_games),
+        'ppg': ppg,
+        'fg_pct': fg_pct,
+        'ft_pct': ft_pct,
+        'plus_minus': plus_minus,
+        'win_pct': win_pct,
+        'total_points': total_points,
+        'total_games': total_games,
+        'clutch_game_pct': round(len(clutch_games) / tracked_games * 100, 1)
+    }
+    
+    return stats
+
+def get_career_clutch_stats(player_id):
+    """Get player's career clutch performance"""
+    try:
+        return _load_career_clutch_stats(player_id)
     except Exception as e:
         return {"error": str(e)}
 
+# (label, stats key, suffix) for each metric shown per player
+CLUTCH_METRICS = (
+    ("Total Games Played", "total_games", ""),
+    ("Clutch Games Played", "games_played", ""),
+    ("% Games That Were Clutch", "clutch_game_pct", "%"),
+    ("Points in Clutch Games", "ppg", "PPG"),
+    ("FG% in Clutch", "fg_pct", "%"),
+    ("FT% in Clutch", "ft_pct", "%"),
+    ("Plus/Minus", "plus_minus", ""),
+    ("Win % in Clutch", "win_pct", "%"),
+    ("Total Clutch Points", "total_points", "")
+)
+
+def display_clutch_stats(stats, name, col, metrics=CLUTCH_METRICS):
+    """Render one player's clutch metrics in the given column"""
+    with col:
+        st.markdown(f"<div class='stat-box'>", unsafe_allow_html=True)
+        st.markdown(f"### {name}")
+        
+        for label, key, suffix in metrics:
+            st.metric(
+                label,
+                f"{stats[key]}{suffix}",
+                delta=None
+            )
+        
+        st.markdown("</div>", unsafe_allow_html=True)
+
 # App header
 st.title("🏀 NBA Career Clutch Performance Analyzer")
 st.markdown("Compare players' career performance in close games (margin ≤ 5 points)")
@@ -115,9 +315,16 @@ if st.button("Compare Players", type="primary"):
             st.error(f"Player not found: {player1 if not p1_id else player2}")
             st.stop()
         
-        # Get clutch stats
-        p1_stats = get_career_clutch_stats(p1_id)
-        p2_stats = get_career_clutch_stats(p2_id)
+        # Get clutch stats for both players concurrently. Pool threads need this
+        # run's ScriptRunContext, otherwise st.cache_data neither reads nor writes.
+        ctx = get_script_run_ctx()
+        with ThreadPoolExecutor(
+            max_workers=2,
+            initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)
+        ) as executor:
+            p1_future = executor.submit(get_career_clutch_stats, p1_id)
+            p2_future = executor.submit(get_career_clutch_stats, p2_id)
+            p1_stats, p2_stats = p1_future.result(), p2_future.result()
         
         # Error handling
         if "error" in p1_stats or "error" in p2_stats:
@@ -129,32 +336,6 @@ if st.button("Compare Players", type="primary"):
         
         col1, col2 = st.columns(2)
         
-        def display_clutch_stats(stats, name, col):
-            with col:
-                st.markdown(f"<div class='stat-box'>", unsafe_allow_html=True)
-                st.markdown(f"### {name}")
-                
-                metrics = [
-                    ("Total Games Played", "total_games", ""),
-                    ("Clutch Games Played", "games_played", ""),
-                    ("% Games That Were Clutch", "clutch_game_pct", "%"),
-                    ("Points in Clutch Games", "ppg", "PPG"),
-                    ("FG% in Clutch", "fg_pct", "%"),
-                    ("FT% in Clutch", "ft_pct", "%"),
-                    ("Plus/Minus", "plus_minus", ""),
-                    ("Win % in Clutch", "win_pct", "%"),
-                    ("Total Clutch Points", "total_points", "")
-                ]
-                
-                for label, key, suffix in metrics:
-                    st.metric(
-                        label,
-                        f"{stats[key]}{suffix}",
-                        delta=None
-                    )
-                
-                st.markdown("</div>", unsafe_allow_html=True)
-        
         # Display both players' stats
         display_clutch_stats(p1_stats, player1, col1)
         display_clutch_stats(p2_stats, player2, col2)